@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 from telegram_bot import get_telegram_bot, check_expiring_members
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify, Response, stream_with_context
 from functools import wraps
 from datetime import datetime, timedelta
 import random
 import string
 import os
-import qrcode
+import hmac
+import hashlib
+import threading
+import tempfile
+import click
 from io import BytesIO
-import base64
 
 app = Flask(__name__)
 
@@ -18,10 +21,51 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 
-from models import db, Member, User, Attendance
+# QR code cache: jumlah PNG di memory dan folder opsional untuk simpan ke disk
+app.config['QR_CACHE_SIZE'] = int(os.environ.get('QR_CACHE_SIZE', 512))
+app.config['QR_CACHE_DIR'] = os.environ.get('QR_CACHE_DIR')
+# Jumlah process untuk export ZIP QR dari web (dibatasi supaya tidak menghabiskan CPU server)
+app.config['QR_EXPORT_WORKERS'] = int(os.environ.get('QR_EXPORT_WORKERS', 2))
+
+# Telegram webhook: jika diisi, bot menerima update lewat /telegram/webhook/<secret> (tanpa thread polling).
+# Nilai env (mis. generateValue Render, base64) bisa berisi / + = yang tidak valid di path URL maupun
+# di secret_token Telegram ([A-Za-z0-9_-]), jadi yang dipakai adalah hex sha256 dari nilai tersebut.
+def telegram_webhook_secret(raw):
+    """Turunkan secret webhook URL-safe dari nilai env TELEGRAM_WEBHOOK_SECRET"""
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest() if raw else None
+
+app.config['TELEGRAM_WEBHOOK_SECRET'] = telegram_webhook_secret(os.environ.get('TELEGRAM_WEBHOOK_SECRET'))
+
+from models import db, Member, User, Attendance, ensure_indexes
+from stats import get_member_stats, get_attendance_today_stats, day_range
+from reports import (get_monthly_summary, get_payments_for_month, iter_payments_by_month, month_label,
+                     payment_export_rows, iter_csv, iter_gzip, write_parquet)
+from ledger import record_payment, last_charge, ensure_ledger, rebuild_monthly_revenue
+from attendance_service import (process_scan, process_scan_batch, receipt_json, open_sessions,
+                                attendance_events, iter_live_events)
+from member_cache import member_cache
+from qr_cache import QRCodeCache, QR_MIMETYPES, iter_qr_zip
 
 db.init_app(app)
 
+qr_cache = QRCodeCache(max_size=app.config['QR_CACHE_SIZE'], cache_dir=app.config['QR_CACHE_DIR'])
+
+# Hanya satu export ZIP QR lewat web dalam satu waktu (export besar pakai CLI export-qr)
+qr_export_lock = threading.Lock()
+
+def init_database():
+    """Buat tabel & index yang belum ada dan isi ledger dari gym.db lama (idempotent)
+
+    Dijalankan sekali sebelum server start (flask init-db / python app.py), bukan per worker
+    gunicorn: backfill ledger tidak aman jika beberapa proses menjalankannya bersamaan.
+    """
+    db.create_all()
+    ensure_indexes()
+    ensure_ledger()
+
+# Jumlah hari default yang ditampilkan di halaman attendance jika tidak ada filter tanggal
+ATTENDANCE_DEFAULT_DAYS = 7
+
 # Decorator untuk protect routes
 def login_required(f):
     @wraps(f)
@@ -57,32 +101,63 @@ def calculate_expire_date(tanggal_daftar, type_member):
         return tanggal_daftar + timedelta(days=365)
     return tanggal_daftar + timedelta(days=30)
 
-def generate_qr_code_base64(member_id):
-    """Generate QR Code dan return base64 string"""
+def get_page_size(default=50, maximum=200):
+    """Ambil parameter size dari query string, dibatasi antara 1 dan maximum"""
     try:
-        qr_data = f"GYM-{member_id}"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        img_io = BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
-        
-        img_base64 = base64.b64encode(img_io.getvalue()).decode()
-        return img_base64
-    except Exception as e:
-        print(f"Error generating QR code: {e}")
+        size = int(request.args.get('size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+def encode_member_cursor(member):
+    """Cursor keyset format: <tanggal_expire ISO>_<id>"""
+    return f"{member.tanggal_expire.isoformat()}_{member.id}"
+
+def decode_member_cursor(cursor):
+    """Parse cursor keyset, return (tanggal_expire, id) atau None jika tidak valid"""
+    try:
+        expire_str, id_str = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(expire_str), int(id_str)
+    except (AttributeError, ValueError):
         return None
 
+def get_active_members_page(today, cursor=None, size=50):
+    """Ambil satu halaman member aktif dengan keyset pagination pada (tanggal_expire, id)"""
+    query = Member.query.filter(Member.tanggal_expire >= today)
+    
+    after = decode_member_cursor(cursor) if cursor else None
+    if after:
+        last_expire, last_id = after
+        query = query.filter(db.or_(
+            Member.tanggal_expire > last_expire,
+            db.and_(Member.tanggal_expire == last_expire, Member.id > last_id)
+        ))
+    
+    # Ambil 1 row lebih untuk tahu apakah masih ada halaman berikutnya
+    members = query.order_by(Member.tanggal_expire.asc(), Member.id.asc()).limit(size + 1).all()
+    
+    next_cursor = None
+    if len(members) > size:
+        members = members[:size]
+        next_cursor = encode_member_cursor(members[-1])
+    
+    return members, next_cursor
+
+def member_card_query(status='aktif', type_member=None):
+    """Query (member_id, nama) untuk cetak kartu QR, filter status aktif/expired/semua dan type member"""
+    today = datetime.now()
+    query = db.session.query(Member.member_id, Member.nama)
+    
+    if status == 'aktif':
+        query = query.filter(Member.tanggal_expire >= today)
+    elif status == 'expired':
+        query = query.filter(Member.tanggal_expire < today)
+    
+    if type_member:
+        query = query.filter(Member.type_member == type_member)
+    
+    return query.order_by(Member.member_id.asc())
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if 'user_id' in session:
@@ -167,9 +242,7 @@ def register_admin():
 def index():
     try:
         today = datetime.now()
-        member_aktif = Member.query.filter(Member.tanggal_expire >= today).count()
-        member_expired = Member.query.filter(Member.tanggal_expire < today).count()
-        total_pendapatan = db.session.query(db.func.sum(Member.total)).scalar() or 0
+        stats = get_member_stats(today)
         
         tiga_hari_kedepan = today + timedelta(days=3)
         member_akan_expired = Member.query.filter(
@@ -177,21 +250,53 @@ def index():
             Member.tanggal_expire <= tiga_hari_kedepan
         ).order_by(Member.tanggal_expire.asc()).all()
         
-        list_member_aktif = Member.query.filter(
-            Member.tanggal_expire >= today
-        ).order_by(Member.tanggal_expire.asc()).all()
+        list_member_aktif, next_cursor = get_active_members_page(today, size=get_page_size())
         
         return render_template('base.html', 
-                             member_aktif=member_aktif,
-                             member_expired=member_expired,
-                             total_pendapatan=total_pendapatan,
+                             member_aktif=stats['member_aktif'],
+                             member_expired=stats['member_expired'],
+                             total_pendapatan=stats['total_pendapatan'],
                              member_akan_expired=member_akan_expired,
                              list_member_aktif=list_member_aktif,
+                             next_cursor=next_cursor,
+                             page_size=get_page_size(),
                              today=today)
     except Exception as e:
         print(f"Error in index: {e}")
         return f"<h1>Error: {str(e)}</h1><p><a href='/'>Back to Home</a></p>"
 
+@app.route('/api/members/aktif')
+@login_required
+def api_members_aktif():
+    """JSON endpoint untuk 'load more' list member aktif di dashboard"""
+    try:
+        today = datetime.now()
+        members, next_cursor = get_active_members_page(
+            today,
+            cursor=request.args.get('cursor'),
+            size=get_page_size()
+        )
+        
+        data = []
+        for member in members:
+            data.append({
+                'member_id': member.member_id,
+                'nama': member.nama,
+                'jenis_kelamin': member.jenis_kelamin,
+                'no_handphone': member.no_handphone,
+                'type_member': member.type_member.replace('_', ' ').title(),
+                'tanggal_daftar': member.tanggal_daftar.strftime('%d-%m-%Y'),
+                'tanggal_expire': member.tanggal_expire.strftime('%d-%m-%Y'),
+                'sisa_hari': (member.tanggal_expire - today).days,
+                'edit_url': url_for('edit_member', member_id=member.member_id),
+                'delete_url': url_for('delete_confirm', member_id=member.member_id)
+            })
+        
+        return jsonify({'members': data, 'next_cursor': next_cursor})
+    except Exception as e:
+        print(f"Error in api_members_aktif: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/register', methods=['GET', 'POST'])
 @login_required
 def register():
@@ -241,9 +346,14 @@ def register():
             )
             
             db.session.add(new_member)
+            record_payment(new_member, 'pendaftaran', total,
+                           biaya_bulanan=biaya_bulanan,
+                           biaya_pendaftaran=biaya_pendaftaran,
+                           tanggal=tanggal_daftar)
             db.session.commit()
+            member_cache.invalidate(new_member.member_id)
             
-# 🔔 TAMBAHKAN INI - Send Telegram notification
+# 🔔 TAMBAHKAN INI - Send Telegram notification (diantrikan, dikirim worker di background)
             try:
                 bot = get_telegram_bot()
                 if bot:
@@ -271,6 +381,11 @@ def edit_member(member_id):
             return redirect(url_for('index'))
         
         if request.method == 'POST':
+            total_lama = member.total
+            type_member_lama = member.type_member
+            biaya_bulanan_lama = member.biaya_bulanan
+            biaya_pendaftaran_lama = member.biaya_pendaftaran
+            
             member.nama = request.form.get('nama', '')
             member.alamat = request.form.get('alamat', '')
             member.jenis_kelamin = request.form.get('jenis_kelamin', '')
@@ -283,16 +398,30 @@ def edit_member(member_id):
             tanggal_daftar = member.tanggal_daftar
             member.tanggal_expire = calculate_expire_date(tanggal_daftar, member.type_member)
             
-            if member.type_member == 'bulanan':
-                member.total = member.biaya_bulanan + member.biaya_pendaftaran
-            elif member.type_member == '3_bulan':
-                member.total = (member.biaya_bulanan * 3) + member.biaya_pendaftaran
-            elif member.type_member == '6_bulan':
-                member.total = (member.biaya_bulanan * 6) + member.biaya_pendaftaran
-            elif member.type_member == 'tahunan':
-                member.total = (member.biaya_bulanan * 12) + member.biaya_pendaftaran
+            # Total hanya dihitung ulang (dan dicatat sebagai koreksi di ledger) jika type/biaya berubah
+            if (member.type_member, member.biaya_bulanan, member.biaya_pendaftaran) != (type_member_lama, biaya_bulanan_lama, biaya_pendaftaran_lama):
+                # Periode hasil perpanjangan tidak dikenai biaya pendaftaran
+                charge = last_charge(member.member_id)
+                termasuk_pendaftaran = charge is None or charge.jenis != 'perpanjangan'
+                biaya_pendaftaran_periode = member.biaya_pendaftaran if termasuk_pendaftaran else 0
+                
+                if member.type_member == 'bulanan':
+                    member.total = member.biaya_bulanan + biaya_pendaftaran_periode
+                elif member.type_member == '3_bulan':
+                    member.total = (member.biaya_bulanan * 3) + biaya_pendaftaran_periode
+                elif member.type_member == '6_bulan':
+                    member.total = (member.biaya_bulanan * 6) + biaya_pendaftaran_periode
+                elif member.type_member == 'tahunan':
+                    member.total = (member.biaya_bulanan * 12) + biaya_pendaftaran_periode
+                
+                # Delta terhadap yang benar-benar ditagih (member.total lama), histori lama tidak diubah
+                if member.total != total_lama or member.biaya_bulanan != biaya_bulanan_lama:
+                    record_payment(member, 'koreksi', member.total - total_lama,
+                                   biaya_bulanan=member.biaya_bulanan - biaya_bulanan_lama,
+                                   biaya_pendaftaran=(member.biaya_pendaftaran - biaya_pendaftaran_lama) if termasuk_pendaftaran else 0)
             
             db.session.commit()
+            member_cache.invalidate(member.member_id)
             
             flash(f'Data member {member.nama} berhasil diupdate!', 'success')
             return redirect(url_for('success', member_id=member.member_id))
@@ -337,7 +466,10 @@ def perpanjangan():
                     elif member.type_member == 'tahunan':
                         member.total = member.biaya_bulanan * 12
                     
+                    record_payment(member, 'perpanjangan', member.total,
+                                   biaya_bulanan=member.biaya_bulanan)
                     db.session.commit()
+                    member_cache.invalidate(member.member_id)
                     
                     flash(f'Member {member.nama} berhasil diperpanjang!', 'success')
                     return redirect(url_for('success', member_id=member.member_id))
@@ -378,6 +510,10 @@ def delete_member(member_id):
         db.session.delete(member)
         db.session.commit()
         
+        qr_cache.invalidate(member_id)
+        member_cache.invalidate(member_id)
+        open_sessions.discard(member_id)
+        
         flash(f'Member {nama} (ID: {member_id}) berhasil dihapus!', 'success')
         return redirect(url_for('index'))
     
@@ -472,7 +608,8 @@ def success(member_id):
             flash('Member tidak ditemukan!', 'error')
             return redirect(url_for('index'))
         
-        qr_image = generate_qr_code_base64(member_id)
+        # QR di-load browser sebagai SVG yang bisa di-cache, bukan base64 inline
+        qr_image = url_for('qrcode_image', member_id=member_id, fmt='svg')
         auto_qr = request.args.get('auto_qr', '0')
         
         return render_template('success.html', 
@@ -487,45 +624,90 @@ def success(member_id):
 @login_required
 def laporan():
     try:
-        all_members = Member.query.all()
-        
-        laporan_data = {}
-        
-        for member in all_members:
-            bulan_tahun = member.tanggal_daftar.strftime('%Y-%m')
-            bulan_label = member.tanggal_daftar.strftime('%B %Y')
-            
-            if bulan_tahun not in laporan_data:
-                laporan_data[bulan_tahun] = {
-                    'bulan_label': bulan_label,
-                    'jumlah_member': 0,
-                    'total_pendapatan': 0,
-                    'member_list': []
-                }
-            
-            laporan_data[bulan_tahun]['jumlah_member'] += 1
-            laporan_data[bulan_tahun]['total_pendapatan'] += member.total
-            laporan_data[bulan_tahun]['member_list'].append(member)
-        
-        laporan_sorted = dict(sorted(laporan_data.items(), reverse=True))
+        # Hanya ringkasan per bulan, detail member diambil on-demand via /laporan/<bulan_tahun>
+        summary = get_monthly_summary()
+        laporan_data = {data['bulan_tahun']: data for data in summary}
         
-        total_keseluruhan = sum(m.total for m in all_members)
-        jumlah_member_keseluruhan = len(all_members)
+        total_keseluruhan = sum(data['total_pendapatan'] for data in summary)
+        jumlah_transaksi_keseluruhan = sum(data['jumlah_transaksi'] for data in summary)
         
         return render_template('laporan.html', 
-                             laporan_data=laporan_sorted,
+                             laporan_data=laporan_data,
                              total_keseluruhan=total_keseluruhan,
-                             jumlah_member_keseluruhan=jumlah_member_keseluruhan)
+                             jumlah_transaksi_keseluruhan=jumlah_transaksi_keseluruhan)
     
     except Exception as e:
         print(f"Error in laporan: {e}")
         flash('Terjadi kesalahan saat memuat laporan!', 'error')
         return redirect(url_for('index'))
 
+@app.route('/laporan/<bulan_tahun>')
+@login_required
+def laporan_bulan(bulan_tahun):
+    """JSON detail pembayaran untuk satu bulan laporan (format YYYY-MM)"""
+    try:
+        payments = get_payments_for_month(bulan_tahun)
+    except ValueError:
+        return jsonify({'error': 'Format bulan harus YYYY-MM'}), 400
+    
+    try:
+        data = []
+        for payment in payments:
+            data.append({
+                'member_id': payment.member_id,
+                'nama': payment.nama,
+                'type_member': payment.type_member.replace('_', ' ').title(),
+                'jenis': payment.jenis.title(),
+                'tanggal': payment.tanggal.strftime('%d-%m-%Y'),
+                'biaya_bulanan': payment.biaya_bulanan,
+                'biaya_pendaftaran': payment.biaya_pendaftaran,
+                'jumlah': payment.jumlah
+            })
+        
+        return jsonify({'bulan_tahun': bulan_tahun, 'payments': data})
+    except Exception as e:
+        print(f"Error in laporan_bulan: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def export_laporan_bulk(export_format):
+    """Export laporan mentah (CSV / CSV gzip / Parquet) langsung dari projected query"""
+    timestamp = datetime.now().strftime('%d-%m-%Y_%H%M%S')
+    
+    if export_format == 'parquet':
+        output = write_parquet(payment_export_rows())
+        if output is not None:
+            return send_file(
+                output,
+                mimetype='application/vnd.apache.parquet',
+                as_attachment=True,
+                download_name=f"Laporan_Pendapatan_{timestamp}.parquet"
+            )
+        # pyarrow tidak terinstall, fallback ke CSV gzip
+        export_format = 'csv.gz'
+    
+    if export_format == 'csv.gz':
+        body = iter_gzip(iter_csv(payment_export_rows()))
+        mimetype = 'application/gzip'
+        filename = f"Laporan_Pendapatan_{timestamp}.csv.gz"
+    else:
+        body = iter_csv(payment_export_rows())
+        mimetype = 'text/csv'
+        filename = f"Laporan_Pendapatan_{timestamp}.csv"
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @app.route('/laporan/export')
 @login_required
 def export_laporan():
     try:
+        export_format = request.args.get('format', 'xlsx').lower()
+        if export_format in ('csv', 'csv.gz', 'parquet'):
+            return export_laporan_bulk(export_format)
+        
         from openpyxl import Workbook
         from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
         
@@ -567,38 +749,19 @@ def export_laporan():
         
         current_row = 4
         
-        all_members = Member.query.all()
-        
-        laporan_data = {}
-        for member in all_members:
-            bulan_tahun = member.tanggal_daftar.strftime('%Y-%m')
-            bulan_label = member.tanggal_daftar.strftime('%B %Y')
-            
-            if bulan_tahun not in laporan_data:
-                laporan_data[bulan_tahun] = {
-                    'bulan_label': bulan_label,
-                    'jumlah_member': 0,
-                    'total_pendapatan': 0,
-                    'member_list': []
-                }
-            
-            laporan_data[bulan_tahun]['jumlah_member'] += 1
-            laporan_data[bulan_tahun]['total_pendapatan'] += member.total
-            laporan_data[bulan_tahun]['member_list'].append(member)
-        
-        laporan_sorted = dict(sorted(laporan_data.items(), reverse=True))
-        
         grand_total = 0
-        grand_member = 0
+        grand_transaksi = 0
         
-        for bulan_tahun, data in laporan_sorted.items():
-            ws[f'A{current_row}'] = f"PERIODE: {data['bulan_label']}"
+        for bulan_tahun, rows in iter_payments_by_month():
+            payment_list = list(rows)
+            
+            ws[f'A{current_row}'] = f"PERIODE: {month_label(bulan_tahun)}"
             ws[f'A{current_row}'].fill = section_fill
             ws[f'A{current_row}'].font = section_font
             ws.merge_cells(f'A{current_row}:H{current_row}')
             current_row += 1
             
-            headers = ['No', 'ID Member', 'Nama', 'Type Member', 'Tanggal Daftar', 'Biaya Bulanan', 'Biaya Pendaftaran', 'Total']
+            headers = ['No', 'ID Member', 'Nama', 'Type / Jenis', 'Tanggal Bayar', 'Biaya Bulanan', 'Biaya Pendaftaran', 'Total']
             for col_num, header in enumerate(headers, 1):
                 cell = ws.cell(row=current_row, column=col_num)
                 cell.value = header
@@ -609,15 +772,15 @@ def export_laporan():
             
             current_row += 1
             
-            for idx, member in enumerate(data['member_list'], 1):
+            for idx, payment in enumerate(payment_list, 1):
                 ws.cell(row=current_row, column=1).value = idx
-                ws.cell(row=current_row, column=2).value = member.member_id
-                ws.cell(row=current_row, column=3).value = member.nama
-                ws.cell(row=current_row, column=4).value = member.type_member.replace('_', ' ').title()
-                ws.cell(row=current_row, column=5).value = member.tanggal_daftar.strftime('%d-%m-%Y')
-                ws.cell(row=current_row, column=6).value = member.biaya_bulanan
-                ws.cell(row=current_row, column=7).value = member.biaya_pendaftaran
-                ws.cell(row=current_row, column=8).value = member.total
+                ws.cell(row=current_row, column=2).value = payment.member_id
+                ws.cell(row=current_row, column=3).value = payment.nama
+                ws.cell(row=current_row, column=4).value = f"{payment.type_member.replace('_', ' ').title()} ({payment.jenis.title()})"
+                ws.cell(row=current_row, column=5).value = payment.tanggal.strftime('%d-%m-%Y')
+                ws.cell(row=current_row, column=6).value = payment.biaya_bulanan
+                ws.cell(row=current_row, column=7).value = payment.biaya_pendaftaran
+                ws.cell(row=current_row, column=8).value = payment.jumlah
                 
                 ws.cell(row=current_row, column=6).number_format = '#,##0'
                 ws.cell(row=current_row, column=7).number_format = '#,##0'
@@ -636,26 +799,26 @@ def export_laporan():
             ws.merge_cells(f'A{current_row}:E{current_row}')
             ws[f'A{current_row}'].alignment = Alignment(horizontal='right')
             
-            ws[f'F{current_row}'].value = f"=SUM(F{current_row-len(data['member_list'])}:F{current_row-1})"
+            ws[f'F{current_row}'].value = f"=SUM(F{current_row-len(payment_list)}:F{current_row-1})"
             ws[f'F{current_row}'].fill = total_fill
             ws[f'F{current_row}'].font = total_font
             ws[f'F{current_row}'].border = border
             ws[f'F{current_row}'].number_format = '#,##0'
             
-            ws[f'G{current_row}'].value = f"=SUM(G{current_row-len(data['member_list'])}:G{current_row-1})"
+            ws[f'G{current_row}'].value = f"=SUM(G{current_row-len(payment_list)}:G{current_row-1})"
             ws[f'G{current_row}'].fill = total_fill
             ws[f'G{current_row}'].font = total_font
             ws[f'G{current_row}'].border = border
             ws[f'G{current_row}'].number_format = '#,##0'
             
-            ws[f'H{current_row}'].value = f"=SUM(H{current_row-len(data['member_list'])}:H{current_row-1})"
+            ws[f'H{current_row}'].value = f"=SUM(H{current_row-len(payment_list)}:H{current_row-1})"
             ws[f'H{current_row}'].fill = total_fill
             ws[f'H{current_row}'].font = total_font
             ws[f'H{current_row}'].border = border
             ws[f'H{current_row}'].number_format = '#,##0'
             
-            grand_total += data['total_pendapatan']
-            grand_member += data['jumlah_member']
+            grand_total += sum(payment.jumlah for payment in payment_list)
+            grand_transaksi += sum(1 for payment in payment_list if payment.jenis != 'koreksi')
             
             current_row += 2
         
@@ -678,8 +841,8 @@ def export_laporan():
         ws[f'A{current_row}'].font = Font(bold=True, size=11)
         current_row += 1
         
-        ws[f'A{current_row}'] = "Total Member:"
-        ws[f'B{current_row}'] = grand_member
+        ws[f'A{current_row}'] = "Total Transaksi:"
+        ws[f'B{current_row}'] = grand_transaksi
         current_row += 1
         
         ws[f'A{current_row}'] = "Total Pendapatan:"
@@ -714,7 +877,7 @@ def generate_qrcode(member_id):
             flash('Member tidak ditemukan!', 'error')
             return redirect(url_for('index'))
         
-        qr_image = generate_qr_code_base64(member_id)
+        qr_image = url_for('qrcode_image', member_id=member_id, fmt='svg')
         
         return render_template('qrcode.html', 
                              member=member, 
@@ -725,126 +888,200 @@ def generate_qrcode(member_id):
         flash('Terjadi kesalahan saat generate QR Code!', 'error')
         return redirect(url_for('index'))
 
+@app.route('/qrcode/batch')
+@login_required
+def qrcode_batch():
+    """Download ZIP berisi PNG QR Code banyak member sekaligus (di-stream selama proses)"""
+    if not qr_export_lock.acquire(blocking=False):
+        flash('Export QR Code lain sedang berjalan, coba lagi sebentar lagi!', 'error')
+        return redirect(url_for('index'))
+    
+    try:
+        status = request.args.get('status', 'aktif')
+        type_member = request.args.get('type_member') or None
+        members = member_card_query(status, type_member).all()
+        
+        filename = f"QR_Member_{status}_{datetime.now().strftime('%d-%m-%Y_%H%M%S')}.zip"
+        
+        # PNG di-render di process pool kecil (spawn), tidak lewat qr_cache supaya cache tidak terisi semua member
+        response = Response(
+            stream_with_context(iter_qr_zip(members, max_workers=app.config['QR_EXPORT_WORKERS'])),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+        response.call_on_close(qr_export_lock.release)
+        return response
+    
+    except Exception as e:
+        qr_export_lock.release()
+        print(f"Error in qrcode_batch: {e}")
+        flash('Terjadi kesalahan saat generate QR Code!', 'error')
+        return redirect(url_for('index'))
+
+@app.route('/qrcode/<member_id>.<any(png, svg):fmt>')
+@login_required
+def qrcode_image(member_id, fmt):
+    """QR Code PNG/SVG dari cache dengan ETag dan Cache-Control panjang (payload tidak pernah berubah)"""
+    try:
+        item = qr_cache.peek(member_id, fmt)
+        if not item:
+            member = Member.query.filter_by(member_id=member_id).first()
+            if not member:
+                return 'Member tidak ditemukan', 404
+            item = qr_cache.get(member_id, fmt)
+        
+        data, etag = item
+        response = Response(data, mimetype=QR_MIMETYPES[fmt])
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = 31536000
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        print(f"Error in qrcode_image: {e}")
+        return 'Terjadi kesalahan saat generate QR Code', 500
+
+def valid_scan_key(key):
+    """Idempotency key scan dari kiosk: string 1-64 karakter"""
+    return isinstance(key, str) and 0 < len(key) <= 64
+
+# HTTP status untuk hasil scan di JSON API
+SCAN_HTTP_STATUS = {'ok': 200, 'invalid': 400, 'expired': 403, 'not_found': 404}
+
+def scan_result_json(result):
+    """Ubah hasil process_scan menjadi dict JSON yang ringan untuk kiosk"""
+    data = {
+        'ok': result['status'] == 'ok',
+        'status': result['status'],
+        'action': result.get('action'),
+        'message': result.get('success') or result.get('error')
+    }
+    
+    member = result.get('member')
+    if member:
+        data['member'] = {
+            'member_id': member.member_id,
+            'nama': member.nama,
+            'type_member': member.type_member.replace('_', ' ').title(),
+            'tanggal_expire': member.tanggal_expire.strftime('%d-%m-%Y')
+        }
+    
+    attendance = result.get('attendance')
+    if attendance:
+        data['attendance'] = {
+            'check_in': attendance.check_in.strftime('%d-%m-%Y %H:%M:%S'),
+            'check_out': attendance.check_out.strftime('%d-%m-%Y %H:%M:%S') if attendance.check_out else None,
+            'time': (attendance.check_out or attendance.check_in).strftime('%H:%M')
+        }
+    
+    if 'duration' in result:
+        data['duration'] = round(result['duration'], 2)
+    
+    return data
+
 @app.route('/scan-public', methods=['GET', 'POST'])
 def scan_public():
     try:
         if request.method == 'POST':
             qr_data = request.form.get('qr_data', '').strip()
-            
-            if qr_data.startswith('GYM-'):
-                member_id = qr_data.replace('GYM-', '')
-                member = Member.query.filter_by(member_id=member_id).first()
-                
-                if not member:
-                    return render_template('scan_public.html', 
-                                         error='Member tidak ditemukan!',
-                                         qr_data=qr_data)
-                
-                today = datetime.now()
-                if member.tanggal_expire < today:
-                    return render_template('scan_public.html', 
-                                         member=member, 
-                                         expired=True,
-                                         error=f'Member {member.nama} sudah expired!')
-                
-                last_attendance = Attendance.query.filter_by(
-                    member_id=member_id
-                ).order_by(Attendance.id.desc()).first()
-                
-                if last_attendance and last_attendance.status == 'check_in' and last_attendance.check_out is None:
-                    last_attendance.check_out = datetime.now()
-                    last_attendance.status = 'check_out'
-                    db.session.commit()
-                    
-                    duration = last_attendance.check_out - last_attendance.check_in
-                    hours = duration.total_seconds() / 3600
-                    
-                    return render_template('scan_public.html', 
-                                         member=member, 
-                                         action='check_out',
-                                         attendance=last_attendance,
-                                         duration=hours,
-                                         success=f'Check-out berhasil! Terima kasih {member.nama}')
-                else:
-                    new_attendance = Attendance(
-                        member_id=member_id,
-                        check_in=datetime.now(),
-                        status='check_in'
-                    )
-                    db.session.add(new_attendance)
-                    db.session.commit()
-                    
-                    return render_template('scan_public.html', 
-                                         member=member, 
-                                         action='check_in',
-                                         attendance=new_attendance,
-                                         success=f'Check-in berhasil! Selamat datang {member.nama}')
-            else:
-                return render_template('scan_public.html', 
-                                     error='QR Code tidak valid! Format harus GYM-XXXXXX')
+            return render_template('scan_public.html', **process_scan(qr_data))
         
         return render_template('scan_public.html')
     
     except Exception as e:
         print(f"Error in scan_public: {e}")
+        db.session.rollback()
         return render_template('scan_public.html', 
                              error='Terjadi kesalahan sistem!')
 
+@app.route('/api/scan', methods=['POST'])
+def api_scan():
+    """JSON check-in/check-out untuk kiosk scan public (tanpa reload halaman)"""
+    try:
+        payload = request.get_json(silent=True) or request.form
+        qr_data = (payload.get('qr_data') or '').strip().upper()
+        key = payload.get('key')
+        
+        if key is None:
+            result = process_scan(qr_data)
+        elif not valid_scan_key(key):
+            return jsonify({'ok': False, 'status': 'invalid', 'message': 'Key scan tidak valid!'}), 400
+        else:
+            # Scan ber-key dari kiosk: jika dikirim ulang (mis. setelah timeout) tidak diproses dua kali.
+            # Scan online selalu memakai waktu server, jam kiosk hanya dipakai untuk antrian offline
+            scan = {'key': key, 'qr_data': qr_data}
+            [(receipt, result)] = process_scan_batch([scan])
+            if result is None:
+                return jsonify(receipt_json(receipt, duplicate=True))
+        
+        return jsonify(scan_result_json(result)), SCAN_HTTP_STATUS[result['status']]
+    
+    except Exception as e:
+        print(f"Error in api_scan: {e}")
+        db.session.rollback()
+        return jsonify({'ok': False, 'status': 'error', 'message': 'Terjadi kesalahan sistem!'}), 500
+
+# Maksimal scan per request /api/scan/batch
+SCAN_BATCH_MAX = 200
+
+@app.route('/api/scan/batch', methods=['POST'])
+def api_scan_batch():
+    """Sync antrian scan offline dari kiosk: satu transaksi, urutan dan idempotency key dijaga"""
+    payload = request.get_json(silent=True) or {}
+    scans = payload.get('scans')
+    
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'ok': False, 'message': 'Format batch tidak valid!'}), 400
+    if len(scans) > SCAN_BATCH_MAX:
+        return jsonify({'ok': False, 'message': f'Maksimal {SCAN_BATCH_MAX} scan per batch!'}), 400
+    
+    for scan in scans:
+        key = scan.get('key') if isinstance(scan, dict) else None
+        if not valid_scan_key(key):
+            return jsonify({'ok': False, 'message': 'Setiap scan wajib punya key (maks 64 karakter)!'}), 400
+        scan['qr_data'] = str(scan.get('qr_data') or '').strip().upper()
+    
+    try:
+        results = process_scan_batch(scans)
+        return jsonify({'ok': True,
+                        'results': [receipt_json(receipt, duplicate=result is None)
+                                    for receipt, result in results]})
+    
+    except Exception as e:
+        print(f"Error in api_scan_batch: {e}")
+        return jsonify({'ok': False, 'message': 'Terjadi kesalahan sistem, batch akan dikirim ulang'}), 503
+
 @app.route('/scan', methods=['GET', 'POST'])
 @login_required
 def scan_qrcode():
     try:
         if request.method == 'POST':
             qr_data = request.form.get('qr_data', '').strip()
+            result = process_scan(qr_data)
             
-            if qr_data.startswith('GYM-'):
-                member_id = qr_data.replace('GYM-', '')
-                member = Member.query.filter_by(member_id=member_id).first()
-                
-                if not member:
-                    flash('Member tidak ditemukan!', 'error')
-                    return redirect(url_for('scan_qrcode'))
-                
-                today = datetime.now()
-                if member.tanggal_expire < today:
-                    flash(f'Member {member.nama} sudah expired! Silakan perpanjang membership.', 'error')
-                    return render_template('scan.html', member=member, expired=True)
-                
-                last_attendance = Attendance.query.filter_by(
-                    member_id=member_id
-                ).order_by(Attendance.id.desc()).first()
-                
-                if last_attendance and last_attendance.status == 'check_in' and last_attendance.check_out is None:
-                    last_attendance.check_out = datetime.now()
-                    last_attendance.status = 'check_out'
-                    db.session.commit()
-                    
-                    flash(f'Check-out berhasil! Terima kasih {member.nama}', 'success')
-                    return render_template('scan.html', 
-                                         member=member, 
-                                         action='check_out',
-                                         attendance=last_attendance)
-                else:
-                    new_attendance = Attendance(
-                        member_id=member_id,
-                        check_in=datetime.now(),
-                        status='check_in'
-                    )
-                    db.session.add(new_attendance)
-                    db.session.commit()
-                    
-                    flash(f'Check-in berhasil! Selamat datang {member.nama}', 'success')
-                    return render_template('scan.html', 
-                                         member=member, 
-                                         action='check_in',
-                                         attendance=new_attendance)
-            else:
+            if result['status'] == 'not_found':
+                flash(result['error'], 'error')
+                return redirect(url_for('scan_qrcode'))
+            
+            if result['status'] == 'invalid':
                 flash('QR Code tidak valid!', 'error')
+                return render_template('scan.html')
+            
+            if result['status'] == 'expired':
+                flash(f"{result['error']} Silakan perpanjang membership.", 'error')
+                return render_template('scan.html', member=result['member'], expired=True)
+            
+            flash(result['success'], 'success')
+            return render_template('scan.html', 
+                                 member=result['member'], 
+                                 action=result['action'],
+                                 attendance=result['attendance'])
         
         return render_template('scan.html')
     
     except Exception as e:
         print(f"Error in scan_qrcode: {e}")
+        db.session.rollback()
         flash('Terjadi kesalahan saat scan QR Code!', 'error')
         return redirect(url_for('scan_qrcode'))
 
@@ -853,34 +1090,46 @@ def scan_qrcode():
 def attendance_list():
     try:
         filter_date = request.args.get('date', '')
-        filter_member = request.args.get('member', '')
+        filter_member = request.args.get('member', '').strip().upper()
+        page = request.args.get('page', 1, type=int)
+        size = get_page_size()
         
-        query = Attendance.query
+        query = Attendance.query.options(db.joinedload(Attendance.member))
         
+        target_date = None
         if filter_date:
             try:
                 target_date = datetime.strptime(filter_date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Attendance.check_in) == target_date)
-            except:
-                pass
+            except ValueError:
+                filter_date = ''
+        
+        if target_date:
+            start, end = day_range(target_date)
+            query = query.filter(Attendance.check_in >= start, Attendance.check_in < end)
+        elif not filter_member:
+            # Default tanpa filter: tampilkan 7 hari terakhir (termasuk hari ini)
+            start, end = day_range(datetime.now().date())
+            start -= timedelta(days=ATTENDANCE_DEFAULT_DAYS - 1)
+            query = query.filter(Attendance.check_in >= start, Attendance.check_in < end)
         
         if filter_member:
-            query = query.filter(Attendance.member_id.like(f'%{filter_member}%'))
-        
-        attendances = query.order_by(Attendance.check_in.desc()).all()
+            # Prefix match sebagai range (bukan LIKE '%x%') supaya bisa pakai ix_attendance_member_id_id
+            query = query.filter(Attendance.member_id >= filter_member,
+                                 Attendance.member_id < filter_member + '\uffff')
         
-        today = datetime.now().date()
-        today_attendances = Attendance.query.filter(
-            db.func.date(Attendance.check_in) == today
-        ).all()
+        pagination = query.order_by(Attendance.check_in.desc()).paginate(
+            page=max(page, 1), per_page=size, error_out=False
+        )
         
-        checked_in_today = len([a for a in today_attendances if a.check_out is None])
-        total_today = len(today_attendances)
+        today_stats = get_attendance_today_stats()
         
         return render_template('attendance.html', 
-                             attendances=attendances,
-                             checked_in_today=checked_in_today,
-                             total_today=total_today,
+                             attendances=pagination.items,
+                             pagination=pagination,
+                             size=size,
+                             default_days=ATTENDANCE_DEFAULT_DAYS,
+                             checked_in_today=open_sessions.count(),
+                             total_today=today_stats['total_today'],
                              filter_date=filter_date,
                              filter_member=filter_member)
     
@@ -889,16 +1138,29 @@ def attendance_list():
         flash('Terjadi kesalahan saat memuat data attendance!', 'error')
         return redirect(url_for('index'))
 
+@app.route('/attendance/live')
+@login_required
+def attendance_live():
+    """Server-sent events: jumlah member di gym dan event check-in/check-out secara real time"""
+    q = attendance_events.subscribe()
+    if q is None:
+        return Response('Terlalu banyak layar live terbuka, coba lagi nanti', status=503, mimetype='text/plain')
+    
+    return Response(stream_with_context(iter_live_events(q)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/attendance/export')
 @login_required
 def export_attendance():
     try:
         from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
         from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
         
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Data Kehadiran"
+        # Write-only workbook: row langsung ditulis ke disk, memory tetap flat berapapun jumlah row
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Data Kehadiran")
         
         ws.column_dimensions['A'].width = 5
         ws.column_dimensions['B'].width = 15
@@ -908,8 +1170,10 @@ def export_attendance():
         ws.column_dimensions['F'].width = 15
         ws.column_dimensions['G'].width = 12
         
+        # Style objects dibuat sekali dan dipakai ulang untuk semua cell
         header_fill = PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid")
         header_font = Font(bold=True, color="FFFFFF", size=12)
+        header_alignment = Alignment(horizontal='center', vertical='center')
         title_font = Font(bold=True, size=14, color="1F4E78")
         border = Border(
             left=Side(style='thin'),
@@ -918,51 +1182,61 @@ def export_attendance():
             bottom=Side(style='thin')
         )
         
-        ws['A1'] = "LAPORAN KEHADIRAN MEMBER GYM"
-        ws['A1'].font = title_font
-        ws.merge_cells('A1:G1')
-        ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
+        def data_row(values):
+            row = []
+            for value in values:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.border = border
+                row.append(cell)
+            return row
         
-        ws['A2'] = f"Tanggal Export: {datetime.now().strftime('%d-%m-%Y %H:%M')}"
-        ws.merge_cells('A2:G2')
-        ws['A2'].alignment = Alignment(horizontal='left')
+        title = WriteOnlyCell(ws, value="LAPORAN KEHADIRAN MEMBER GYM")
+        title.font = title_font
+        ws.append([title])
+        ws.append([f"Tanggal Export: {datetime.now().strftime('%d-%m-%Y %H:%M')}"])
+        ws.append([])
         
-        current_row = 4
         headers = ['No', 'ID Member', 'Nama', 'Check-in', 'Check-out', 'Durasi (jam)', 'Status']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=col_num)
-            cell.value = header
+        header_row = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
             cell.fill = header_fill
             cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
+            cell.alignment = header_alignment
             cell.border = border
-        
-        current_row += 1
-        
-        attendances = Attendance.query.order_by(Attendance.check_in.desc()).all()
-        
-        for idx, attendance in enumerate(attendances, 1):
-            ws.cell(row=current_row, column=1).value = idx
-            ws.cell(row=current_row, column=2).value = attendance.member_id
-            ws.cell(row=current_row, column=3).value = attendance.member.nama
-            ws.cell(row=current_row, column=4).value = attendance.check_in.strftime('%d-%m-%Y %H:%M:%S')
-            
-            if attendance.check_out:
-                ws.cell(row=current_row, column=5).value = attendance.check_out.strftime('%d-%m-%Y %H:%M:%S')
-                duration = (attendance.check_out - attendance.check_in).total_seconds() / 3600
-                ws.cell(row=current_row, column=6).value = round(duration, 2)
-                ws.cell(row=current_row, column=7).value = "Check-out"
+            header_row.append(cell)
+        ws.append(header_row)
+        
+        # Ambil hanya kolom yang dibutuhkan dalam satu query JOIN, dibaca bertahap per batch
+        attendances = db.session.query(
+            Attendance.member_id,
+            Member.nama,
+            Attendance.check_in,
+            Attendance.check_out
+        ).outerjoin(
+            Member, Member.member_id == Attendance.member_id
+        ).order_by(Attendance.check_in.desc()).yield_per(1000)
+        
+        for idx, (member_id, nama, check_in, check_out) in enumerate(attendances, 1):
+            if check_out:
+                duration = (check_out - check_in).total_seconds() / 3600
+                values = [
+                    idx, member_id, nama or '-',
+                    check_in.strftime('%d-%m-%Y %H:%M:%S'),
+                    check_out.strftime('%d-%m-%Y %H:%M:%S'),
+                    round(duration, 2),
+                    "Check-out"
+                ]
             else:
-                ws.cell(row=current_row, column=5).value = "-"
-                ws.cell(row=current_row, column=6).value = "-"
-                ws.cell(row=current_row, column=7).value = "Check-in"
-            
-            for col in range(1, 8):
-                ws.cell(row=current_row, column=col).border = border
-            
-            current_row += 1
-        
-        output = BytesIO()
+                values = [
+                    idx, member_id, nama or '-',
+                    check_in.strftime('%d-%m-%Y %H:%M:%S'),
+                    "-", "-", "Check-in"
+                ]
+            ws.append(data_row(values))
+        
+        # File sementara di disk lalu di-stream ke client oleh send_file
+        output = tempfile.TemporaryFile()
         wb.save(output)
         output.seek(0)
         
@@ -986,7 +1260,7 @@ def telegram_check_expiry():
     """Manual trigger untuk check member yang akan expired"""
     try:
         check_expiring_members(app)
-        flash('Telegram alert berhasil dikirim!', 'success')
+        flash('Telegram alert sedang dikirim di background!', 'success')
     except Exception as e:
         flash(f'Error: {str(e)}', 'error')
     
@@ -999,24 +1273,7 @@ def telegram_test():
     try:
         bot = get_telegram_bot()
         if bot:
-            today = datetime.now()
-            member_aktif = Member.query.filter(Member.tanggal_expire >= today).count()
-            member_expired = Member.query.filter(Member.tanggal_expire < today).count()
-            total_pendapatan = db.session.query(db.func.sum(Member.total)).scalar() or 0
-            
-            tiga_hari_kedepan = today + timedelta(days=3)
-            akan_expired = Member.query.filter(
-                Member.tanggal_expire >= today,
-                Member.tanggal_expire <= tiga_hari_kedepan
-            ).count()
-            
-            stats = {
-                'member_aktif': member_aktif,
-                'member_expired': member_expired,
-                'akan_expired': akan_expired,
-                'total_pendapatan': total_pendapatan
-            }
-            
+            stats = get_member_stats()
             bot.send_daily_summary(stats)
             flash('Test message berhasil dikirim ke Telegram!', 'success')
         else:
@@ -1026,17 +1283,87 @@ def telegram_test():
     
     return redirect(url_for('index'))
 
+@app.route('/telegram/webhook/<secret>', methods=['POST'])
+def telegram_webhook(secret):
+    """Terima update dari Telegram (webhook mode), diproses oleh dispatcher yang sama dengan polling"""
+    expected = app.config['TELEGRAM_WEBHOOK_SECRET']
+    # Bandingkan bytes: compare_digest menolak str non-ASCII dengan TypeError
+    if not expected or not hmac.compare_digest(secret.encode('utf-8'), expected.encode('utf-8')):
+        return jsonify({'ok': False}), 404
+    
+    # Jika webhook didaftarkan dengan secret_token, Telegram juga mengirim header ini
+    header_token = request.headers.get('X-Telegram-Bot-Api-Secret-Token')
+    if header_token is not None and not hmac.compare_digest(header_token.encode('utf-8'), expected.encode('utf-8')):
+        return jsonify({'ok': False}), 403
+    
+    bot = get_telegram_bot()
+    update = request.get_json(silent=True)
+    if bot and update:
+        bot.flask_app = app
+        bot.dispatch_update(update)
+    
+    # Balas cepat, command dijalankan worker di background supaya Telegram tidak retry
+    return jsonify({'ok': True})
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Buat tabel dan index yang belum ada (aman dijalankan di gym.db lama)"""
+    init_database()
+    print("✅ Database tables & indexes ready")
+
+
+@app.cli.command('export-qr')
+@click.argument('output')
+@click.option('--status', default='aktif', type=click.Choice(['aktif', 'expired', 'semua']))
+@click.option('--type-member', default=None, help='Filter type member, contoh: bulanan')
+@click.option('--workers', default=None, type=int, help='Jumlah proses (default: jumlah CPU)')
+def export_qr_command(output, status, type_member, workers):
+    """Generate ZIP berisi PNG QR Code member ke file OUTPUT"""
+    members = member_card_query(status, type_member).all()
+    with open(output, 'wb') as f:
+        for chunk in iter_qr_zip(members, max_workers=workers):
+            f.write(chunk)
+    print(f"✅ {len(members)} QR Code disimpan ke {output}")
+
+
+@app.cli.command('rebuild-revenue')
+def rebuild_revenue_command():
+    """Hitung ulang tabel rollup monthly_revenue dari ledger pembayaran"""
+    rebuild_monthly_revenue()
+    print("✅ Monthly revenue rollup rebuilt")
+
+
+@app.cli.command('telegram-webhook')
+@click.argument('base_url', required=False)
+@click.option('--delete', is_flag=True, help='Hapus webhook dan kembali ke mode polling')
+def telegram_webhook_command(base_url, delete):
+    """Daftarkan webhook bot ke BASE_URL/telegram/webhook/<secret>, contoh: https://gym.onrender.com"""
+    bot = get_telegram_bot()
+    if not bot:
+        return
+    
+    if delete:
+        print(bot.delete_webhook())
+        return
+    
+    secret = app.config['TELEGRAM_WEBHOOK_SECRET']
+    if not base_url or not secret:
+        raise click.UsageError('BASE_URL dan env TELEGRAM_WEBHOOK_SECRET wajib diisi')
+    
+    print(bot.set_webhook(f"{base_url.rstrip('/')}/telegram/webhook/{secret}", secret_token=secret))
+
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_database()
+        open_sessions.warm()
     
-    # Start Telegram Bot in production
-    import threading
-    from telegram_bot import run_telegram_bot
-    
-    bot_thread = threading.Thread(target=lambda: run_telegram_bot(app), daemon=True)
-    bot_thread.start()
+    # Start Telegram Bot in production (mode polling, hanya jika webhook tidak dipakai)
+    if not app.config['TELEGRAM_WEBHOOK_SECRET']:
+        from telegram_bot import run_telegram_bot
+        
+        bot_thread = threading.Thread(target=lambda: run_telegram_bot(app), daemon=True)
+        bot_thread.start()
     
     # Get port from environment (for Render)
     import os
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, Attendance, ProcessedScan
+from member_cache import member_cache
+
+# Toleransi jam kiosk yang lebih cepat dari server
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# Scan offline yang lebih lama dari ini ditolak (batas lama kiosk boleh offline)
+MAX_OFFLINE_AGE = timedelta(hours=12)
+
+# Idempotency key disimpan selama ini, cukup lebih lama dari MAX_OFFLINE_AGE
+PROCESSED_SCAN_RETENTION = timedelta(days=7)
+PRUNE_INTERVAL = 3600
+
+# Scan member yang sama dalam rentang ini dianggap scan ganda, bukan check-out
+SCAN_DEBOUNCE = timedelta(seconds=10)
+
+
+class OpenSessionIndex:
+    """Index in-process sesi yang belum check-out: member_id -> (attendance id, check_in)
+
+    Di-warm dari database saat pertama dipakai dan di-sync ulang setiap refresh_interval
+    detik, supaya tetap akurat walau ada worker lain yang ikut menulis attendance.
+    """
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._warmed_at = None
+
+    def warm(self):
+        """Muat ulang semua sesi terbuka dari database"""
+        rows = db.session.query(Attendance.member_id, Attendance.id, Attendance.check_in).filter(
+            Attendance.check_out.is_(None)
+        ).all()
+
+        with self._lock:
+            self._sessions = {member_id: (attendance_id, check_in) for member_id, attendance_id, check_in in rows}
+            self._warmed_at = time.monotonic()
+
+    def ensure_warm(self):
+        if self._warmed_at is None or time.monotonic() - self._warmed_at > self.refresh_interval:
+            self.warm()
+
+    def get(self, member_id):
+        """Return attendance id sesi terbuka member, atau None"""
+        self.ensure_warm()
+        session = self._sessions.get(member_id)
+        return session[0] if session else None
+
+    def add(self, member_id, attendance_id, check_in):
+        with self._lock:
+            self._sessions[member_id] = (attendance_id, check_in)
+
+    def discard(self, member_id):
+        with self._lock:
+            self._sessions.pop(member_id, None)
+
+    def count(self, today=None):
+        """Jumlah member yang sedang di gym: sesi terbuka yang check-in hari ini
+
+        Sesi lama yang lupa check-out tetap terbuka (scan berikutnya menutupnya),
+        tapi tidak dihitung sebagai orang di gym.
+        """
+        self.ensure_warm()
+        start = datetime.combine(today or datetime.now().date(), datetime.min.time())
+        with self._lock:
+            return sum(1 for _, check_in in self._sessions.values() if check_in >= start)
+
+
+open_sessions = OpenSessionIndex()
+
+
+class AttendanceEvents:
+    """Pub/sub in-process untuk event check-in/check-out (dipakai stream /attendance/live)
+
+    Setiap subscriber memakai satu thread worker selama stream terbuka, jadi jumlahnya
+    dibatasi max_subscribers supaya request lain (mis. kiosk /api/scan) tetap kebagian thread.
+    """
+
+    def __init__(self, max_queue=100, max_subscribers=3):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Return queue event baru, atau None jika jumlah subscriber sudah penuh"""
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Client terlalu lambat, event dilewati (occupancy tetap ikut di event berikutnya)
+                pass
+
+
+attendance_events = AttendanceEvents()
+
+
+def occupancy_event():
+    """Event awal untuk client baru: jumlah member yang sedang di gym"""
+    return {'type': 'occupancy', 'occupancy': open_sessions.count()}
+
+
+def format_sse(event):
+    """Format dict event menjadi pesan server-sent events"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def iter_live_events(q, keepalive=15, max_duration=300, retry_ms=3000):
+    """Generator SSE untuk queue hasil attendance_events.subscribe()
+
+    Kirim occupancy saat ini lalu setiap event scan, dengan komentar keepalive. Stream
+    ditutup setelah max_duration detik supaya thread worker dilepas; EventSource otomatis
+    reconnect setelah retry_ms.
+    """
+    deadline = time.monotonic() + max_duration
+    try:
+        yield f"retry: {retry_ms}\n\n"
+        yield format_sse(occupancy_event())
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = q.get(timeout=min(keepalive, remaining))
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(event)
+    finally:
+        attendance_events.unsubscribe(q)
+
+
+def get_open_session(member_id):
+    """Ambil sesi attendance member yang belum check-out (maksimal satu, dijaga unique index)"""
+    return Attendance.query.filter(
+        Attendance.member_id == member_id,
+        Attendance.check_out.is_(None)
+    ).first()
+
+
+def toggle_attendance(member_id, now=None, commit=True):
+    """Toggle check-in/check-out member secara atomik, return (action, attendance)
+
+    Keputusan check-in/check-out diambil dari open_sessions (tanpa query). Dua scan yang
+    hampir bersamaan tidak bisa membuat dua check-in: sesi terbuka dijaga oleh partial
+    unique index ux_attendance_open_session, dan check-out memakai UPDATE bersyarat
+    sehingga hanya satu scan yang menutup sesi.
+
+    commit=False dipakai oleh batch sync: perubahan hanya di-flush, commit/rollback
+    (dan warm ulang open_sessions jika gagal) dilakukan oleh pemanggil.
+    """
+    now = now or datetime.now()
+    attendance_id = open_sessions.get(member_id)
+
+    if attendance_id:
+        closed = Attendance.query.filter(
+            Attendance.id == attendance_id,
+            Attendance.check_out.is_(None)
+        ).update({
+            # Scan offline yang di-replay bisa lebih tua dari check-in sesi: jangan sampai durasi negatif
+            Attendance.check_out: db.case((Attendance.check_in > now, Attendance.check_in), else_=now),
+            Attendance.status: 'check_out'
+        }, synchronize_session=False)
+        if commit:
+            db.session.commit()
+        open_sessions.discard(member_id)
+
+        if closed:
+            return 'check_out', Attendance.query.populate_existing().get(attendance_id)
+
+        # Sesi sudah ditutup di tempat lain (index basi), scan ini dihitung sebagai check-in baru
+
+    attendance = Attendance(
+        member_id=member_id,
+        check_in=now,
+        status='check_in'
+    )
+    db.session.add(attendance)
+
+    if not commit:
+        db.session.flush()
+    else:
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Sudah ada sesi terbuka (dibuat worker lain, index proses ini basi): sync entry member ini
+            db.session.rollback()
+            existing = get_open_session(member_id)
+            if existing is None:
+                raise
+            open_sessions.add(member_id, existing.id, existing.check_in)
+
+            if now - existing.check_in < SCAN_DEBOUNCE:
+                # Scan ganda yang hampir bersamaan, tetap dihitung satu check-in
+                return 'check_in', existing
+
+            # Member sudah check-in sebelumnya, jadi scan ini adalah check-out sesi tersebut
+            return toggle_attendance(member_id, now=now, commit=commit)
+
+    open_sessions.add(member_id, attendance.id, attendance.check_in)
+    return 'check_in', attendance
+
+
+def publish_scan(result):
+    """Kirim event scan yang berhasil ke subscriber /attendance/live"""
+    attendance = result['attendance']
+    attendance_events.publish({
+        'type': 'scan',
+        'action': result['action'],
+        'member_id': result['member'].member_id,
+        'nama': result['member'].nama,
+        'time': (attendance.check_out or attendance.check_in).strftime('%H:%M:%S'),
+        'occupancy': open_sessions.count()
+    })
+
+
+def process_scan(qr_data, scanned_at=None, commit=True):
+    """Validasi hasil scan QR lalu toggle check-in/check-out, return dict hasil untuk semua scan route
+
+    scanned_at: waktu scan di kiosk (untuk scan offline yang baru dikirim belakangan)
+    """
+    if not qr_data.startswith('GYM-'):
+        return {'status': 'invalid', 'error': 'QR Code tidak valid! Format harus GYM-XXXXXX'}
+
+    member_id = qr_data.replace('GYM-', '')
+    member = member_cache.get(member_id)
+
+    if not member:
+        return {'status': 'not_found', 'error': 'Member tidak ditemukan!'}
+
+    scanned_at = scanned_at or datetime.now()
+    if member.tanggal_expire < scanned_at:
+        return {'status': 'expired',
+                'member': member,
+                'expired': True,
+                'error': f'Member {member.nama} sudah expired!'}
+
+    action, attendance = toggle_attendance(member_id, now=scanned_at, commit=commit)
+
+    if action == 'check_out':
+        duration = attendance.check_out - attendance.check_in
+        result = {'status': 'ok',
+                  'member': member,
+                  'action': 'check_out',
+                  'attendance': attendance,
+                  'duration': duration.total_seconds() / 3600,
+                  'success': f'Check-out berhasil! Terima kasih {member.nama}'}
+    else:
+        result = {'status': 'ok',
+                  'member': member,
+                  'action': 'check_in',
+                  'attendance': attendance,
+                  'success': f'Check-in berhasil! Selamat datang {member.nama}'}
+
+    if commit:
+        publish_scan(result)
+    return result
+
+
+def client_scan_time(value, now):
+    """Waktu scan dari kiosk (epoch milidetik)
+
+    Jatuh ke waktu server jika kosong, tidak valid atau di masa depan. Return None jika
+    lebih lama dari MAX_OFFLINE_AGE (scan ditolak).
+    """
+    try:
+        scanned_at = datetime.fromtimestamp(float(value) / 1000)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+
+    if scanned_at > now + MAX_CLOCK_SKEW:
+        return now
+    if scanned_at < now - MAX_OFFLINE_AGE:
+        return None
+    return scanned_at
+
+
+_last_prune = None
+
+
+def prune_processed_scans(now=None):
+    """Hapus idempotency key yang sudah lewat masa simpan (maksimal sekali per PRUNE_INTERVAL per proses)"""
+    global _last_prune
+
+    if _last_prune is not None and time.monotonic() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.monotonic()
+
+    cutoff = (now or datetime.now()) - PROCESSED_SCAN_RETENTION
+    ProcessedScan.query.filter(ProcessedScan.processed_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def receipt_json(receipt, duplicate=False):
+    return {
+        'key': receipt.key,
+        'ok': receipt.status == 'ok',
+        'status': receipt.status,
+        'action': receipt.action,
+        'member_id': receipt.member_id,
+        'message': receipt.message,
+        'duplicate': duplicate
+    }
+
+
+def process_scan_batch(scans):
+    """Proses scan ber-idempotency key dari kiosk dalam satu transaksi, urut sesuai antrian
+
+    scans: list of dict {'key', 'qr_data', 'scanned_at'}; tanpa scanned_at dipakai waktu
+    server. Return list of (receipt, result); key yang sudah pernah diproses tidak diproses
+    ulang dan result-nya None, jadi batch aman dikirim ulang.
+    """
+    now = datetime.now()
+    keys = [scan['key'] for scan in scans]
+    receipts = {
+        receipt.key: receipt
+        for receipt in ProcessedScan.query.filter(ProcessedScan.key.in_(keys))
+    }
+
+    results = []
+    scanned = []
+    try:
+        for scan in scans:
+            key = scan['key']
+            if key in receipts:
+                results.append((receipts[key], None))
+                continue
+
+            scanned_at = client_scan_time(scan.get('scanned_at'), now)
+            if scanned_at is None:
+                scanned_at = now
+                result = {'status': 'invalid',
+                          'error': 'Scan offline sudah terlalu lama, silakan scan ulang'}
+            else:
+                result = process_scan(scan['qr_data'], scanned_at=scanned_at, commit=False)
+            member = result.get('member')
+
+            receipt = ProcessedScan(
+                key=key,
+                member_id=member.member_id if member else None,
+                status=result['status'],
+                action=result.get('action'),
+                message=result.get('success') or result.get('error'),
+                scanned_at=scanned_at
+            )
+            db.session.add(receipt)
+            receipts[key] = receipt
+
+            results.append((receipt, result))
+            if result['status'] == 'ok':
+                scanned.append(result)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # open_sessions sudah ikut berubah selama batch, sinkronkan lagi dengan database
+        open_sessions.warm()
+        raise
+
+    for result in scanned:
+        publish_scan(result)
+
+    prune_processed_scans(now)
+    return results
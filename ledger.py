@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from models import db, Member, Payment, MonthlyRevenue
+
+
+def record_payment(member, jenis, jumlah, biaya_bulanan=0, biaya_pendaftaran=0, tanggal=None):
+    """Catat pembayaran ke ledger dan update rollup bulanan (commit dilakukan oleh pemanggil)"""
+    tanggal = tanggal or datetime.now()
+
+    payment = Payment(
+        member_id=member.member_id,
+        nama=member.nama,
+        type_member=member.type_member,
+        jenis=jenis,
+        tanggal=tanggal,
+        biaya_bulanan=biaya_bulanan,
+        biaya_pendaftaran=biaya_pendaftaran,
+        jumlah=jumlah
+    )
+    db.session.add(payment)
+
+    # Koreksi hanya mengubah nominal, bukan jumlah transaksi
+    transaksi = 0 if jenis == 'koreksi' else 1
+    bulan_tahun = tanggal.strftime('%Y-%m')
+
+    updated = MonthlyRevenue.query.filter_by(bulan_tahun=bulan_tahun).update({
+        MonthlyRevenue.jumlah_transaksi: MonthlyRevenue.jumlah_transaksi + transaksi,
+        MonthlyRevenue.total_pendapatan: MonthlyRevenue.total_pendapatan + jumlah,
+        MonthlyRevenue.total_biaya_bulanan: MonthlyRevenue.total_biaya_bulanan + biaya_bulanan,
+        MonthlyRevenue.total_biaya_pendaftaran: MonthlyRevenue.total_biaya_pendaftaran + biaya_pendaftaran
+    }, synchronize_session=False)
+
+    if not updated:
+        db.session.add(MonthlyRevenue(
+            bulan_tahun=bulan_tahun,
+            jumlah_transaksi=transaksi,
+            total_pendapatan=jumlah,
+            total_biaya_bulanan=biaya_bulanan,
+            total_biaya_pendaftaran=biaya_pendaftaran
+        ))
+
+    return payment
+
+
+def last_charge(member_id):
+    """Pembayaran terakhir member selain koreksi (pendaftaran atau perpanjangan periode berjalan)"""
+    return Payment.query.filter(
+        Payment.member_id == member_id,
+        Payment.jenis != 'koreksi'
+    ).order_by(Payment.tanggal.desc(), Payment.id.desc()).first()
+
+
+def backfill_payments():
+    """Isi ledger dari data member lama, satu pembayaran pendaftaran per member"""
+    for member in Member.query.all():
+        db.session.add(Payment(
+            member_id=member.member_id,
+            nama=member.nama,
+            type_member=member.type_member,
+            jenis='pendaftaran',
+            tanggal=member.tanggal_daftar,
+            biaya_bulanan=member.biaya_bulanan,
+            biaya_pendaftaran=member.biaya_pendaftaran,
+            jumlah=member.total
+        ))
+    db.session.commit()
+
+
+def rebuild_monthly_revenue():
+    """Hitung ulang seluruh rollup bulanan dari ledger"""
+    bulan = db.func.strftime('%Y-%m', Payment.tanggal).label('bulan_tahun')
+
+    rows = db.session.query(
+        bulan,
+        db.func.sum(db.case((Payment.jenis == 'koreksi', 0), else_=1)),
+        db.func.sum(Payment.jumlah),
+        db.func.sum(Payment.biaya_bulanan),
+        db.func.sum(Payment.biaya_pendaftaran)
+    ).group_by(bulan).all()
+
+    MonthlyRevenue.query.delete()
+    for bulan_tahun, transaksi, total, biaya_bulanan, biaya_pendaftaran in rows:
+        db.session.add(MonthlyRevenue(
+            bulan_tahun=bulan_tahun,
+            jumlah_transaksi=transaksi or 0,
+            total_pendapatan=total or 0,
+            total_biaya_bulanan=biaya_bulanan or 0,
+            total_biaya_pendaftaran=biaya_pendaftaran or 0
+        ))
+    db.session.commit()
+
+
+def ensure_ledger():
+    """Migrasi database lama: isi ledger dari tabel member jika ledger masih kosong"""
+    if Payment.query.first() is None and Member.query.first() is not None:
+        backfill_payments()
+        rebuild_monthly_revenue()
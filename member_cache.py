@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from models import Member
+
+# Snapshot read-only data member (semua kolom), aman dipakai di luar session/app context
+MemberInfo = namedtuple('MemberInfo', [column.name for column in Member.__table__.columns])
+
+
+def member_info(member):
+    """Buat snapshot MemberInfo dari object Member"""
+    return MemberInfo(*(getattr(member, field) for field in MemberInfo._fields))
+
+
+class MemberCache:
+    """LRU cache member_id -> MemberInfo dengan TTL, untuk lookup cepat di scan route dan bot Telegram"""
+
+    def __init__(self, max_size=2048, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, member_id):
+        """Return MemberInfo, baca dari database jika belum ada atau sudah kadaluarsa (None jika tidak ada)"""
+        now = time.monotonic()
+
+        with self._lock:
+            item = self._items.get(member_id)
+            if item and item[1] > now:
+                self._items.move_to_end(member_id)
+                return item[0]
+
+        member = Member.query.filter_by(member_id=member_id).first()
+        if not member:
+            return None
+
+        info = member_info(member)
+        with self._lock:
+            self._items[member_id] = (info, now + self.ttl)
+            self._items.move_to_end(member_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return info
+
+    def invalidate(self, member_id):
+        """Hapus member dari cache setelah data member berubah"""
+        with self._lock:
+            self._items.pop(member_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+member_cache = MemberCache()
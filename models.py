@@ -10,7 +10,7 @@ class Member(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.String(20), unique=True, nullable=False)
     tanggal_daftar = db.Column(db.DateTime, nullable=False, default=datetime.now)
-    tanggal_expire = db.Column(db.DateTime, nullable=False)
+    tanggal_expire = db.Column(db.DateTime, nullable=False, index=True)
     type_member = db.Column(db.String(50), nullable=False)
     biaya_bulanan = db.Column(db.Float, nullable=False)
     biaya_pendaftaran = db.Column(db.Float, nullable=False)
@@ -51,7 +51,7 @@ class Attendance(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.String(20), db.ForeignKey('members.member_id'), nullable=False)
-    check_in = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    check_in = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
     check_out = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='check_in')  # check_in, check_out
     
@@ -60,3 +60,80 @@ class Attendance(db.Model):
     
     def __repr__(self):
         return f'<Attendance {self.member_id} - {self.check_in}>'
+
+class Payment(db.Model):
+    """Ledger pembayaran (append-only), data member di-snapshot supaya histori tetap ada walau member dihapus"""
+    __tablename__ = 'payments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    member_id = db.Column(db.String(20), nullable=False, index=True)
+    nama = db.Column(db.String(100), nullable=False)
+    type_member = db.Column(db.String(50), nullable=False)
+    jenis = db.Column(db.String(20), nullable=False)  # pendaftaran, perpanjangan, koreksi
+    tanggal = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+    biaya_bulanan = db.Column(db.Float, nullable=False, default=0)
+    biaya_pendaftaran = db.Column(db.Float, nullable=False, default=0)
+    jumlah = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<Payment {self.member_id} - {self.jenis} - {self.jumlah}>'
+
+class MonthlyRevenue(db.Model):
+    """Rollup pendapatan per bulan, di-update incremental setiap ada Payment baru"""
+    __tablename__ = 'monthly_revenue'
+    
+    bulan_tahun = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    jumlah_transaksi = db.Column(db.Integer, nullable=False, default=0)
+    total_pendapatan = db.Column(db.Float, nullable=False, default=0)
+    total_biaya_bulanan = db.Column(db.Float, nullable=False, default=0)
+    total_biaya_pendaftaran = db.Column(db.Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<MonthlyRevenue {self.bulan_tahun} - {self.total_pendapatan}>'
+
+class ProcessedScan(db.Model):
+    """Idempotency key scan dari kiosk (antrian offline), supaya batch yang dikirim ulang tidak diproses dua kali"""
+    __tablename__ = 'processed_scans'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    member_id = db.Column(db.String(20))
+    status = db.Column(db.String(20), nullable=False)  # ok, invalid, not_found, expired
+    action = db.Column(db.String(20))  # check_in, check_out
+    message = db.Column(db.String(200))
+    scanned_at = db.Column(db.DateTime, nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+    
+    def __repr__(self):
+        return f'<ProcessedScan {self.key} - {self.status}>'
+
+# Scan route mencari attendance terakhir per member (ORDER BY id DESC)
+db.Index('ix_attendance_member_id_id', Attendance.member_id, Attendance.id.desc())
+
+# Maksimal satu sesi terbuka (belum check-out) per member, mencegah double check-in saat scan bersamaan
+db.Index('ux_attendance_open_session', Attendance.member_id, unique=True,
+         sqlite_where=Attendance.check_out.is_(None),
+         postgresql_where=Attendance.check_out.is_(None))
+
+
+def close_duplicate_open_sessions():
+    """Tutup sesi terbuka ganda dari data lama (hanya sesi terbaru per member yang dibiarkan terbuka)"""
+    latest_open = db.select(db.func.max(Attendance.id)).where(
+        Attendance.check_out.is_(None)
+    ).group_by(Attendance.member_id)
+
+    Attendance.query.filter(
+        Attendance.check_out.is_(None),
+        Attendance.id.notin_(latest_open)
+    ).update({
+        Attendance.check_out: Attendance.check_in,
+        Attendance.status: 'check_out'
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def ensure_indexes():
+    """Buat index yang belum ada di database lama (db.create_all tidak menambah index ke tabel yang sudah ada)"""
+    close_duplicate_open_sessions()
+    for table in (Member.__table__, Attendance.__table__, Payment.__table__, ProcessedScan.__table__):
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
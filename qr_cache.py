@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import qrcode
+import qrcode.image.svg
+
+QR_MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+
+def qr_payload(member_id):
+    """Isi QR code member (format yang dibaca oleh scan route)"""
+    return f"GYM-{member_id}"
+
+
+def _make_qr(member_id):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(qr_payload(member_id))
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr_png(member_id):
+    """Render QR code member menjadi bytes PNG"""
+    img = _make_qr(member_id).make_image(fill_color="black", back_color="white")
+
+    img_io = BytesIO()
+    img.save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+def render_qr_svg(member_id):
+    """Render QR code member menjadi SVG dengan background putih (vector, tanpa rasterisasi PIL)"""
+    img = _make_qr(member_id).make_image(image_factory=qrcode.image.svg.SvgPathFillImage)
+
+    img_io = BytesIO()
+    img.save(img_io)
+    return img_io.getvalue()
+
+
+def render_qr(member_id, fmt='png'):
+    """Render QR code member dalam format 'png' atau 'svg'"""
+    if fmt == 'svg':
+        return render_qr_svg(member_id)
+    return render_qr_png(member_id)
+
+
+class QRCodeCache:
+    """LRU cache QR code (PNG/SVG) per member_id, opsional disimpan juga ke disk"""
+
+    def __init__(self, max_size=512, cache_dir=None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, member_id, fmt):
+        return os.path.join(self.cache_dir, f"{member_id}.{fmt}")
+
+    def _remember(self, key, data):
+        etag = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._items[key] = (data, etag)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return data, etag
+
+    def peek(self, member_id, fmt='png'):
+        """Return (data, etag) jika sudah ada di memory, tanpa render"""
+        key = (member_id, fmt)
+        with self._lock:
+            item = self._items.get(key)
+            if item:
+                self._items.move_to_end(key)
+            return item
+
+    def get(self, member_id, fmt='png'):
+        """Return (data, etag), render dan simpan ke cache jika belum ada"""
+        item = self.peek(member_id, fmt)
+        if item:
+            return item
+
+        key = (member_id, fmt)
+
+        if self.cache_dir:
+            path = self._disk_path(member_id, fmt)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return self._remember(key, f.read())
+
+        data = render_qr(member_id, fmt)
+
+        if self.cache_dir:
+            # Tulis ke file sementara lalu rename supaya worker lain tidak membaca file setengah jadi
+            path = self._disk_path(member_id, fmt)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        return self._remember(key, data)
+
+    def invalidate(self, member_id):
+        """Hapus semua format QR code member dari cache (memory dan disk)"""
+        with self._lock:
+            for fmt in QR_MIMETYPES:
+                self._items.pop((member_id, fmt), None)
+
+        if self.cache_dir:
+            for fmt in QR_MIMETYPES:
+                try:
+                    os.remove(self._disk_path(member_id, fmt))
+                except FileNotFoundError:
+                    pass
+
+
+class _StreamBuffer:
+    """File-like object write-only untuk zipfile, isinya diambil per potongan untuk di-stream"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def qr_card_filename(member_id, nama):
+    """Nama file PNG di dalam ZIP, contoh: MG123456_Budi_Santoso.png"""
+    safe_nama = re.sub(r'[^A-Za-z0-9]+', '_', nama or '').strip('_')
+    return f"{member_id}_{safe_nama}.png" if safe_nama else f"{member_id}.png"
+
+
+def iter_zip_entries(entries):
+    """Tulis (filename, bytes) ke ZIP dan yield potongan ZIP bytes sambil berjalan"""
+    buffer = _StreamBuffer()
+
+    # PNG sudah terkompres, jadi ZIP_STORED cukup
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for filename, data in entries:
+            zf.writestr(filename, data)
+            yield buffer.pop()
+
+    yield buffer.pop()
+
+
+def iter_qr_zip(members, max_workers=None, chunksize=32):
+    """Generate PNG QR untuk banyak member pakai process pool (CLI export-qr dan /qrcode/batch)
+
+    members: list of (member_id, nama). Pool memakai context 'spawn' supaya aman walau
+    proses pemanggil punya thread lain (fork dari proses ber-thread bisa deadlock).
+    """
+    member_ids = [member_id for member_id, _ in members]
+    max_workers = max_workers or min(4, os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pngs = pool.map(render_qr_png, member_ids, chunksize=chunksize)
+        entries = ((qr_card_filename(member_id, nama), png) for (member_id, nama), png in zip(members, pngs))
+        yield from iter_zip_entries(entries)
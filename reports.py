@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+from itertools import groupby
+from models import db, Payment, MonthlyRevenue
+
+EXPORT_COLUMNS = [
+    'member_id', 'nama', 'type_member', 'tanggal', 'jenis',
+    'biaya_bulanan', 'biaya_pendaftaran', 'jumlah'
+]
+
+
+def month_label(bulan_tahun):
+    """Ubah 'YYYY-MM' menjadi label seperti 'January 2025'"""
+    return datetime.strptime(bulan_tahun, '%Y-%m').strftime('%B %Y')
+
+
+def month_range(bulan_tahun):
+    """Return rentang [awal bulan, awal bulan berikutnya) untuk 'YYYY-MM'"""
+    start = datetime.strptime(bulan_tahun, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def get_monthly_summary():
+    """Ambil ringkasan pendapatan per bulan dari tabel rollup, bulan terbaru dulu"""
+    rows = MonthlyRevenue.query.order_by(MonthlyRevenue.bulan_tahun.desc()).all()
+
+    return [{
+        'bulan_tahun': row.bulan_tahun,
+        'bulan_label': month_label(row.bulan_tahun),
+        'jumlah_transaksi': row.jumlah_transaksi,
+        'total_pendapatan': row.total_pendapatan,
+        'total_biaya_bulanan': row.total_biaya_bulanan,
+        'total_biaya_pendaftaran': row.total_biaya_pendaftaran
+    } for row in rows]
+
+
+def get_payments_for_month(bulan_tahun):
+    """Ambil detail pembayaran di bulan tertentu dari ledger"""
+    start, end = month_range(bulan_tahun)
+    return Payment.query.filter(
+        Payment.tanggal >= start,
+        Payment.tanggal < end
+    ).order_by(Payment.tanggal.asc(), Payment.id.asc()).all()
+
+
+def iter_payments_by_month():
+    """Group projected export rows per bulan dalam satu query (bulan terbaru dulu)"""
+    return groupby(payment_export_rows(), key=lambda row: row.tanggal.strftime('%Y-%m'))
+
+
+def payment_export_rows(batch_size=1000):
+    """Projected query ledger untuk export laporan (tanpa ORM object), dibaca bertahap per batch"""
+    return db.session.query(
+        Payment.member_id,
+        Payment.nama,
+        Payment.type_member,
+        Payment.tanggal,
+        Payment.jenis,
+        Payment.biaya_bulanan,
+        Payment.biaya_pendaftaran,
+        Payment.jumlah
+    ).order_by(Payment.tanggal.desc(), Payment.id.desc()).yield_per(batch_size)
+
+
+def iter_csv(rows, flush_every=500):
+    """Generator CSV, yield text per beberapa ratus row supaya bisa di-stream ke client"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for idx, row in enumerate(rows, 1):
+        row = list(row)
+        row[3] = row[3].strftime('%Y-%m-%d %H:%M:%S')
+        writer.writerow(row)
+
+        if idx % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
+def iter_gzip(chunks):
+    """Kompres stream text menjadi gzip secara bertahap"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_parquet(rows, batch_size=10000):
+    """Tulis rows ke file Parquet sementara, return None jika pyarrow tidak terinstall"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+
+    schema = pa.schema([
+        ('member_id', pa.string()),
+        ('nama', pa.string()),
+        ('type_member', pa.string()),
+        ('tanggal', pa.timestamp('us')),
+        ('jenis', pa.string()),
+        ('biaya_bulanan', pa.float64()),
+        ('biaya_pendaftaran', pa.float64()),
+        ('jumlah', pa.float64())
+    ])
+
+    def to_table(batch):
+        columns = list(zip(*batch))
+        arrays = [pa.array(col, type=field.type) for col, field in zip(columns, schema)]
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    output = tempfile.TemporaryFile()
+    writer = pq.ParquetWriter(output, schema)
+
+    batch = []
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= batch_size:
+            writer.write_table(to_table(batch))
+            batch = []
+    if batch:
+        writer.write_table(to_table(batch))
+
+    writer.close()
+    output.seek(0)
+    return output
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from models import db, Member, Attendance, MonthlyRevenue
+
+
+def day_range(target_date):
+    """Return rentang [awal hari, awal hari berikutnya) supaya filter tanggal bisa pakai index"""
+    start = datetime.combine(target_date, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def get_member_stats(today=None):
+    """Hitung statistik member (aktif, expired, akan expired, pendapatan) dalam satu query"""
+    today = today or datetime.now()
+    tiga_hari_kedepan = today + timedelta(days=3)
+
+    aktif = Member.tanggal_expire >= today
+    akan_expired = db.and_(aktif, Member.tanggal_expire <= tiga_hari_kedepan)
+
+    # Pendapatan dibaca dari rollup bulanan (subquery), tetap satu round-trip
+    total_pendapatan = db.session.query(
+        db.func.sum(MonthlyRevenue.total_pendapatan)
+    ).scalar_subquery()
+
+    row = db.session.query(
+        db.func.sum(db.case((aktif, 1), else_=0)),
+        db.func.sum(db.case((Member.tanggal_expire < today, 1), else_=0)),
+        db.func.sum(db.case((akan_expired, 1), else_=0)),
+        total_pendapatan
+    ).one()
+
+    return {
+        'member_aktif': row[0] or 0,
+        'member_expired': row[1] or 0,
+        'akan_expired': row[2] or 0,
+        'total_pendapatan': row[3] or 0
+    }
+
+
+def get_attendance_today_stats(today=None):
+    """Hitung total kunjungan dan member yang belum check-out hari ini dalam satu query"""
+    start, end = day_range(today or datetime.now().date())
+
+    row = db.session.query(
+        db.func.count(Attendance.id),
+        db.func.sum(db.case((Attendance.check_out.is_(None), 1), else_=0))
+    ).filter(
+        Attendance.check_in >= start,
+        Attendance.check_in < end
+    ).one()
+
+    return {
+        'total_today': row[0] or 0,
+        'checked_in_today': row[1] or 0
+    }
@@ -2,29 +2,125 @@
 import os
 import requests
 from datetime import datetime, timedelta
-from models import Member, db
+from models import Member
+from stats import get_member_stats
+from member_cache import member_cache
 import threading
 import time
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# Bisa diarahkan ke stub server lokal untuk testing, contoh: TELEGRAM_API_URL=http://127.0.0.1:8081
+TELEGRAM_API_URL = 'https://api.telegram.org'
+
+# Batas panjang satu pesan Telegram
+MESSAGE_LIMIT = 4096
+
+
+def split_message(records, header='', footer='', limit=MESSAGE_LIMIT):
+    """Gabungkan records menjadi beberapa pesan <= limit, dipotong hanya di batas record
+
+    header ikut di pesan pertama dan footer di pesan terakhir. Record yang sendiri sudah
+    lebih panjang dari limit terpaksa dipotong per karakter.
+    """
+    chunks = []
+    current = header
+    
+    for record in list(records) + [footer]:
+        pieces = [record[i:i + limit] for i in range(0, len(record), limit)] or ['']
+        for piece in pieces:
+            if current and len(current) + len(piece) > limit:
+                chunks.append(current)
+                current = ''
+            current += piece
+    
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TokenBucket:
+    """Token bucket thread-safe: rate token per detik, maksimal capacity token tersimpan"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Ambil satu token, tunggu jika kosong (token dipesan dulu supaya pemanggil dilayani berurutan)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        
+        if wait:
+            time.sleep(wait)
+
+
+class ChatRateLimiter:
+    """Rate limit pengiriman sesuai batas Telegram: per chat (~1 pesan/detik) dan global (~30 pesan/detik)"""
+    
+    def __init__(self, per_chat_rate=1, per_chat_burst=2, global_rate=30):
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._lock = threading.Lock()
+    
+    def acquire(self, chat_id):
+        with self._lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        
+        bucket.acquire()
+        self._global.acquire()
 
 class TelegramBot:
-    def __init__(self, token, chat_id=None):
+    def __init__(self, token, chat_id=None, api_url=None, session=None):
         self.token = token
         self.chat_id = chat_id
-        self.base_url = f"https://api.telegram.org/bot{token}"
+        self.api_url = (api_url or TELEGRAM_API_URL).rstrip('/')
+        self.base_url = f"{self.api_url}/bot{token}"
         self.last_update_id = 0
         self.flask_app = None
+        self.session = session or self._make_session()
+        self.outbox = NotificationQueue(self)
+        self.limiter = ChatRateLimiter()
+        self.dispatcher = UpdateDispatcher(self.handle_command)
+    
+    @staticmethod
+    def _make_session():
+        """HTTP session keep-alive, koneksi (dan TLS handshake) dipakai ulang untuk setiap request"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def post_message(self, message, chat_id=None, parse_mode="HTML"):
+        """Kirim sendMessage dan return response mentah (exception jaringan tidak ditangkap)"""
+        target_chat_id = chat_id or self.chat_id
+        url = f"{self.base_url}/sendMessage"
+        data = {
+            "chat_id": target_chat_id,
+            "text": message,
+            "parse_mode": parse_mode
+        }
+        self.limiter.acquire(str(target_chat_id))
+        return self.session.post(url, data=data, timeout=10)
     
     def send_message(self, message, chat_id=None, parse_mode="HTML"):
         """Send message to Telegram"""
         try:
-            target_chat_id = chat_id or self.chat_id
-            url = f"{self.base_url}/sendMessage"
-            data = {
-                "chat_id": target_chat_id,
-                "text": message,
-                "parse_mode": parse_mode
-            }
-            response = requests.post(url, data=data, timeout=10)
+            response = self.post_message(message, chat_id, parse_mode)
             
             if response.status_code == 200:
                 return True
@@ -37,18 +133,38 @@ class TelegramBot:
             return False
     
     def get_updates(self, offset=None):
-        """Get updates from Telegram"""
+        """Get updates from Telegram (long polling), return None jika request gagal"""
         try:
             url = f"{self.base_url}/getUpdates"
             params = {"timeout": 30, "offset": offset}
-            response = requests.get(url, params=params, timeout=35)
+            response = self.session.get(url, params=params, timeout=35)
             
             if response.status_code == 200:
                 return response.json().get('result', [])
-            return []
+            print(f"❌ Get updates failed: {response.text}")
+            return None
         except Exception as e:
             print(f"❌ Get updates error: {e}")
-            return []
+            return None
+    
+    def set_webhook(self, url, secret_token=None):
+        """Daftarkan webhook ke Telegram (getUpdates otomatis nonaktif selama webhook terpasang)"""
+        data = {"url": url}
+        if secret_token:
+            data["secret_token"] = secret_token
+        response = self.session.post(f"{self.base_url}/setWebhook", data=data, timeout=10)
+        return response.json()
+    
+    def delete_webhook(self):
+        """Hapus webhook supaya bot bisa kembali memakai polling"""
+        response = self.session.post(f"{self.base_url}/deleteWebhook", timeout=10)
+        return response.json()
+    
+    def dispatch_update(self, update):
+        """Teruskan update (dari polling atau webhook) ke dispatcher command"""
+        if 'message' in update:
+            message = update['message']
+            self.dispatcher.dispatch(message['chat']['id'], message)
     
     def handle_command(self, message):
         """Handle incoming command"""
@@ -133,7 +249,7 @@ Contoh: <code>MG698144</code>
         with self.flask_app.app_context():
             try:
                 member_id = args[0].strip().upper()
-                member = Member.query.filter_by(member_id=member_id).first()
+                member = member_cache.get(member_id)
                 
                 if not member:
                     self.send_message(
@@ -320,17 +436,11 @@ Contoh: <code>MG698144</code>
         """Command /stats"""
         with self.flask_app.app_context():
             try:
-                today = datetime.now()
-                
-                aktif = Member.query.filter(Member.tanggal_expire >= today).count()
-                expired = Member.query.filter(Member.tanggal_expire < today).count()
-                total = db.session.query(db.func.sum(Member.total)).scalar() or 0
-                
-                three_days = today + timedelta(days=3)
-                akan_exp = Member.query.filter(
-                    Member.tanggal_expire >= today,
-                    Member.tanggal_expire <= three_days
-                ).count()
+                stats = get_member_stats()
+                aktif = stats['member_aktif']
+                expired = stats['member_expired']
+                akan_exp = stats['akan_expired']
+                total = stats['total_pendapatan']
                 
                 msg = "📊 <b>STATISTIK GYM</b>\n"
                 msg += "━━━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -381,10 +491,11 @@ Contoh: <code>MG698144</code>
         if not members:
             return
         
-        msg = "🚨 <b>ALERT: Member Akan Expired</b>\n"
-        msg += "━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        header = "🚨 <b>ALERT: Member Akan Expired</b>\n"
+        header += "━━━━━━━━━━━━━━━━━━━━━━\n\n"
         
         today = datetime.now().date()
+        records = []
         
         for m in members:
             days = (m.tanggal_expire.date() - today).days
@@ -396,35 +507,78 @@ Contoh: <code>MG698144</code>
             else:
                 st = f"📅 <b>{days} hari lagi</b>"
             
-            msg += f"👤 <b>{m.nama}</b>\n"
-            msg += f"🆔 <code>{m.member_id}</code>\n"
-            msg += f"📱 {m.no_handphone}\n"
-            msg += f"💳 {m.type_member.replace('_', ' ').title()}\n"
-            msg += f"📅 {m.tanggal_expire.strftime('%d-%m-%Y')}\n"
-            msg += f"⏰ {st}\n"
-            msg += "━━━━━━━━━━━━━━━━━━━━━━\n\n"
+            record = f"👤 <b>{m.nama}</b>\n"
+            record += f"🆔 <code>{m.member_id}</code>\n"
+            record += f"📱 {m.no_handphone}\n"
+            record += f"💳 {m.type_member.replace('_', ' ').title()}\n"
+            record += f"📅 {m.tanggal_expire.strftime('%d-%m-%Y')}\n"
+            record += f"⏰ {st}\n"
+            record += "━━━━━━━━━━━━━━━━━━━━━━\n\n"
+            records.append(record)
         
-        msg += f"📊 Total: <b>{len(members)}</b> member"
+        footer = f"📊 Total: <b>{len(members)}</b> member"
+        
+        self.send_records(records, chat_id, header=header, footer=footer)
+    
+    def send_records(self, records, chat_id=None, header='', footer=''):
+        """Antrikan daftar record panjang sebagai beberapa pesan (<= 4096 karakter) ke outbox
+
+        Worker outbox mengirim berurutan lewat rate limiter dan me-retry 429/5xx, jadi
+        pemanggil (request web / command bot) tidak menunggu semua potongan terkirim.
+        """
+        results = [self.notify(chunk, chat_id) for chunk in split_message(records, header, footer)]
+        return all(results)
+    
+    def notify(self, message, chat_id=None):
+        """Antrikan pesan untuk dikirim di background, return False jika antrian penuh / chat_id kosong"""
+        target_chat_id = chat_id or self.chat_id
+        if not target_chat_id:
+            return False
+        return self.outbox.put(message, target_chat_id)
+    
+    def send_new_member_alert(self, member):
+        """Notifikasi member baru (dikirim lewat antrian background, tidak menahan request)"""
+        msg = "🎉 <b>MEMBER BARU</b>\n"
+        msg += "━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        msg += f"🆔 ID: <code>{member.member_id}</code>\n"
+        msg += f"👤 Nama: <b>{member.nama}</b>\n"
+        msg += f"📱 HP: {member.no_handphone}\n"
+        msg += f"💳 Type: <b>{member.type_member.replace('_', ' ').title()}</b>\n"
+        msg += f"💰 Total: Rp {member.total:,.0f}\n"
+        msg += f"📅 Expired: {member.tanggal_expire.strftime('%d-%m-%Y')}"
+        
+        return self.notify(msg)
+    
+    def send_daily_summary(self, stats):
+        """Kirim ringkasan statistik gym ke chat admin"""
+        msg = "📊 <b>RINGKASAN GYM</b>\n"
+        msg += "━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        msg += f"✅ Aktif: <b>{stats['member_aktif']}</b>\n"
+        msg += f"❌ Expired: <b>{stats['member_expired']}</b>\n"
+        msg += f"⚠️ Akan Expired (3hr): <b>{stats['akan_expired']}</b>\n"
+        msg += f"💵 Total Pendapatan: <b>Rp {stats['total_pendapatan']:,.0f}</b>\n\n"
+        msg += f"🕒 {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}"
         
-        self.send_message(msg, chat_id)
+        return self.send_message(msg)
     
     def start_polling(self, flask_app):
-        """Start polling for updates"""
+        """Start polling for updates, command dijalankan paralel lewat UpdateDispatcher"""
         self.flask_app = flask_app
         print("🤖 Telegram Bot polling started!")
         print("📋 Commands: /start, /help, /cek, /cari, /expired, /aktif, /stats, /alert")
         
         while True:
             try:
+                # getUpdates sudah long polling (timeout 30 detik), tidak perlu sleep di antara request
                 updates = self.get_updates(self.last_update_id + 1)
                 
+                if updates is None:
+                    time.sleep(5)
+                    continue
+                
                 for update in updates:
                     self.last_update_id = update['update_id']
-                    
-                    if 'message' in update:
-                        self.handle_command(update['message'])
-                
-                time.sleep(1)
+                    self.dispatch_update(update)
                 
             except KeyboardInterrupt:
                 print("🛑 Bot stopped by user")
@@ -434,16 +588,127 @@ Contoh: <code>MG698144</code>
                 time.sleep(5)
 
 
+class UpdateDispatcher:
+    """Jalankan handler update di thread pool terbatas, update dari chat yang sama tetap berurutan"""
+    
+    def __init__(self, handler, max_workers=4):
+        self.handler = handler
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='telegram-cmd')
+        self._pending = {}  # chat_id -> deque update yang menunggu
+        self._lock = threading.Lock()
+    
+    def dispatch(self, chat_id, message):
+        with self._lock:
+            pending = self._pending.get(chat_id)
+            if pending is not None:
+                # Chat ini sedang diproses worker lain, antrikan di belakangnya
+                pending.append(message)
+                return
+            self._pending[chat_id] = deque([message])
+        
+        self._pool.submit(self._drain, chat_id)
+    
+    def _drain(self, chat_id):
+        """Proses semua update chat_id satu per satu sampai antriannya kosong"""
+        while True:
+            with self._lock:
+                pending = self._pending[chat_id]
+                if not pending:
+                    del self._pending[chat_id]
+                    return
+                message = pending.popleft()
+            
+            try:
+                self.handler(message)
+            except Exception as e:
+                print(f"❌ Dispatch error: {e}")
+
+
+class NotificationQueue:
+    """Antrian notifikasi keluar dengan worker thread, retry + exponential backoff
+
+    Request handler cukup put() lalu langsung lanjut, jadi Telegram yang lambat/down
+    tidak menambah latency registrasi. Antrian dibatasi max_size; jika penuh pesan dibuang.
+    """
+    
+    def __init__(self, bot, max_size=1000, max_retries=5, backoff=2):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=max_size)
+        self._worker = None
+        self._lock = threading.Lock()
+    
+    def put(self, message, chat_id):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((message, chat_id))
+            return True
+        except queue.Full:
+            print("⚠️ Telegram notification queue full, message dropped")
+            return False
+    
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='telegram-notifier', daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            message, chat_id = self._queue.get()
+            try:
+                self._deliver(message, chat_id)
+            finally:
+                self._queue.task_done()
+    
+    def _deliver(self, message, chat_id):
+        """Kirim satu pesan, retry untuk error jaringan, 429 dan 5xx"""
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff ** attempt
+            
+            try:
+                response = self.bot.post_message(message, chat_id)
+                
+                if response.status_code == 200:
+                    return True
+                if response.status_code != 429 and response.status_code < 500:
+                    print(f"❌ Notification rejected: {response.text}")
+                    return False
+                if response.status_code == 429:
+                    # Telegram memberi tahu berapa detik harus menunggu
+                    delay = response.json().get('parameters', {}).get('retry_after', delay)
+                    
+            except Exception as e:
+                print(f"❌ Notification error (attempt {attempt + 1}): {e}")
+            
+            if attempt < self.max_retries:
+                time.sleep(delay)
+        
+        print(f"❌ Notification dropped after {self.max_retries + 1} attempts")
+        return False
+
+
+_bot = None
+_bot_lock = threading.Lock()
+
+
 def get_telegram_bot():
-    """Get Telegram Bot instance"""
+    """Get Telegram Bot instance (satu instance per proses, dibuat ulang jika konfigurasi env berubah)"""
+    global _bot
+    
     token = os.environ.get('TELEGRAM_BOT_TOKEN')
     chat_id = os.environ.get('TELEGRAM_CHAT_ID')
+    api_url = os.environ.get('TELEGRAM_API_URL', TELEGRAM_API_URL).rstrip('/')
     
-    if token:
-        return TelegramBot(token, chat_id)
-    else:
+    if not token:
         print("⚠️ TELEGRAM_BOT_TOKEN not set")
         return None
+    
+    with _bot_lock:
+        if _bot is None or (_bot.token, _bot.chat_id, _bot.api_url) != (token, chat_id, api_url):
+            _bot = TelegramBot(token, chat_id, api_url=api_url)
+        return _bot
 
 
 def check_expiring_members(app):
@@ -466,7 +731,7 @@ def check_expiring_members(app):
             
             if members and bot.chat_id:
                 bot.send_expiry_alert(members, bot.chat_id)
-                print(f"✅ Alert sent for {len(members)} members")
+                print(f"✅ Alert queued for {len(members)} members")
             else:
                 print("ℹ️ No members expiring")
                 